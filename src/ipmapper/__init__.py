@@ -8,19 +8,25 @@ IPv6 lookups with country names and currency information.
 
 __version__ = "1.2.0"
 
-from .countries import get_country_info
-from .lookup import (
-    IPLookup,
-    get_country_code_for_ip,
-    get_country_currency_for_ip,
-    get_country_name_for_ip,
-    ipv4_lookup,
-    ipv6_lookup,
-    lookup,
-)
+import importlib
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .countries import get_country_info
+    from .lookup import (
+        IPLookup,
+        get_country_code_for_ip,
+        get_country_currency_for_ip,
+        get_country_name_for_ip,
+        ipv4_lookup,
+        ipv6_lookup,
+        lookup,
+        lookup_batch,
+    )
 
 __all__ = [
     "lookup",
+    "lookup_batch",
     "get_country_name_for_ip",
     "get_country_code_for_ip",
     "get_country_currency_for_ip",
@@ -30,6 +36,37 @@ __all__ = [
     "ipv6_lookup",
 ]
 
+# Public names and the submodule that defines them. They are imported on first
+# access so that "import ipmapper" and CLI startup stay cheap.
+_LAZY_ATTRS = {
+    "get_country_info": "countries",
+    "IPLookup": "lookup",
+    "get_country_code_for_ip": "lookup",
+    "get_country_currency_for_ip": "lookup",
+    "get_country_name_for_ip": "lookup",
+    "ipv4_lookup": "lookup",
+    "ipv6_lookup": "lookup",
+    "lookup": "lookup",
+    "lookup_batch": "lookup",
+}
+
+
+def __getattr__(name):
+    """Import public names lazily (PEP 562)."""
+    module_name = _LAZY_ATTRS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+    module = importlib.import_module(f".{module_name}", __name__)
+    for attr, source in _LAZY_ATTRS.items():
+        if source == module_name:
+            globals()[attr] = getattr(module, attr)
+    return globals()[name]
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
+
 
 def main():
     """Entry point for the CLI."""
@@ -1,7 +1,86 @@
 """Prefix aggregation for optimizing IP prefix lists."""
 
-import ipaddress
 from collections import defaultdict
+from ipaddress import IPv4Network, IPv6Network
+from itertools import count, repeat
+
+_NETWORK_CLASSES = {4: IPv4Network, 6: IPv6Network}
+
+
+def _collapse_sorted(addrs, lens, max_prefixlen):
+    """Collapse sorted (address, prefixlen) columns into the minimal CIDR set.
+
+    The input must be sorted by (address, prefixlen). A single sweep keeps the
+    survivors on two parallel stacks, dropping prefixes covered by the last
+    survivor and merging sibling prefixes into their parent.
+
+    Returns:
+        Tuple of (addresses, prefix lengths) lists for the collapsed prefixes
+    """
+    out_addrs = []
+    out_lens = []
+
+    for addr, prefixlen in zip(addrs, lens):
+        if out_addrs and addr < out_addrs[-1] + (1 << (max_prefixlen - out_lens[-1])):
+            continue
+
+        while out_addrs and out_lens[-1] == prefixlen and prefixlen:
+            size = 1 << (max_prefixlen - prefixlen)
+            top_addr = out_addrs[-1]
+            if top_addr ^ addr != size or top_addr & ((size << 1) - 1):
+                break
+            out_addrs.pop()
+            out_lens.pop()
+            addr = top_addr
+            prefixlen -= 1
+
+        out_addrs.append(addr)
+        out_lens.append(prefixlen)
+
+    return out_addrs, out_lens
+
+
+def _network_from_int(network_cls, addr, prefixlen):
+    """Build a network from an aligned integer address and prefix length.
+
+    Bypasses the public constructor, which re-parses its argument and checks
+    for host bits; the merge sweep only yields aligned prefixes. Netmasks come
+    from the per-class cache kept by the ipaddress module.
+    """
+    # pylint: disable=protected-access
+    if prefixlen >= network_cls._max_prefixlen - 1:
+        # /31, /32, /127 and /128 networks carry a custom hosts() in __init__.
+        return network_cls((addr, prefixlen))
+
+    network = network_cls.__new__(network_cls)
+    network.network_address = network_cls._address_class(addr)
+    network.netmask, network._prefixlen = network_cls._make_netmask(prefixlen)
+    return network
+
+
+def _collapse(pairs, max_prefixlen):
+    """Collapse (address, prefixlen) pairs of one IP version into the minimal set.
+
+    Returns:
+        Tuple of (addresses, prefix lengths) sequences for the collapsed prefixes
+    """
+    if len(pairs) == 1:
+        ((addr, prefixlen),) = pairs
+        return [addr], [prefixlen]
+
+    addrs, lens = zip(*sorted(pairs))
+    return _collapse_sorted(addrs, lens, max_prefixlen)
+
+
+def _collapse_group(pairs, version, cc, start):
+    """Collapse one group and decorate the result for sorting.
+
+    Returns:
+        Iterator of (version, address, index, prefixlen, cc) tuples, with
+        indexes counting up from start
+    """
+    addrs, lens = _collapse(pairs, 32 if version == 4 else 128)
+    return zip(repeat(version), addrs, count(start), lens, repeat(cc))
 
 
 class PrefixAggregator:
@@ -16,52 +95,52 @@ class PrefixAggregator:
         Returns:
             List of aggregated (prefix, country_code) tuples
         """
+        return self._aggregate(
+            [
+                ((prefix.version, int(prefix.network_address), prefix.prefixlen), cc)
+                for prefix, cc in prefix_cc_pairs
+            ]
+        )
+
+    def aggregate_entries(self, entries):
+        """Aggregate RIR entries, whose prefixes are already integer tuples."""
+        return self._aggregate([(entry.prefix, entry.cc) for entry in entries])
+
+    def _aggregate(self, prefix_cc_pairs):
+        """Aggregate ((version, address, prefixlen), country_code) pairs.
+
+        The sweep runs on integers; network objects are built only for the
+        aggregated prefixes.
+
+        Returns:
+            List of aggregated (prefix, country_code) tuples sorted by version
+            and network address
+        """
         print("Aggregating prefixes...")
 
-        groups = defaultdict(lambda: defaultdict(list))
+        groups = defaultdict(list)
 
-        for prefix, cc in prefix_cc_pairs:
-            ip_version = "ipv4" if isinstance(prefix, ipaddress.IPv4Network) else "ipv6"
-            groups[cc][ip_version].append(prefix)
+        for (version, addr, prefixlen), cc in prefix_cc_pairs:
+            groups[(cc, version)].append((addr, prefixlen))
 
-        aggregated_pairs = []
         original_count = len(prefix_cc_pairs)
-        processed = 0
-        total_groups = sum(len(version_groups) for version_groups in groups.values())
-
-        for cc, version_groups in groups.items():
-            for ip_version, prefixes in version_groups.items():
-                processed += 1
-                if processed % 10 == 0 or processed == total_groups:
-                    print(
-                        "  Processing group "
-                        + str(processed)
-                        + "/"
-                        + str(total_groups)
-                        + " ("
-                        + cc
-                        + " "
-                        + ip_version
-                        + ")"
-                    )
-
-                try:
-                    collapsed = list(ipaddress.collapse_addresses(prefixes))
-                    for prefix in collapsed:
-                        aggregated_pairs.append((prefix, cc))
-                except (ValueError, TypeError) as e:
-                    print(
-                        "  Warning: Aggregation failed for "
-                        + cc
-                        + " "
-                        + ip_version
-                        + ": "
-                        + str(e)
-                    )
-                    for prefix in prefixes:
-                        aggregated_pairs.append((prefix, cc))
-
-        aggregated_pairs.sort(key=lambda x: (str(type(x[0])), x[0].network_address))
+        total_groups = len(groups)
+
+        # The index keeps ties in group order and stops tuple comparison there.
+        decorated = []
+        for processed, ((cc, version), pairs) in enumerate(groups.items(), 1):
+            if processed % 10 == 0 or processed == total_groups:
+                print(
+                    f"  Processing group {processed}/{total_groups} ({cc} ipv{version})"
+                )
+
+            decorated.extend(_collapse_group(pairs, version, cc, len(decorated)))
+
+        decorated.sort()
+        aggregated_pairs = [
+            (_network_from_int(_NETWORK_CLASSES[version], addr, prefixlen), cc)
+            for version, addr, _, prefixlen, cc in decorated
+        ]
 
         reduction = (
             100 * (1 - len(aggregated_pairs) / original_count)
@@ -69,18 +148,8 @@ class PrefixAggregator:
             else 0
         )
         print(
-            "  Aggregated "
-            + str(original_count)
-            + " -> "
-            + str(len(aggregated_pairs))
-            + " prefixes ("
-            + f"{reduction:.1f}"
-            + "% reduction)"
+            f"  Aggregated {original_count} -> {len(aggregated_pairs)} "
+            f"prefixes ({reduction:.1f}% reduction)"
         )
 
         return aggregated_pairs
-
-    def aggregate_entries(self, entries):
-        """Aggregate RIR entries by converting to prefix-CC pairs first."""
-        prefix_cc_pairs = [(entry.prefix, entry.cc) for entry in entries]
-        return self.aggregate_prefixes(prefix_cc_pairs)
@@ -1,23 +1,15 @@
 """Command-line interface for ipmapper."""
 
+import csv
+import io
 import json
+import os
 import sys
 import time
 from pathlib import Path
 
 import click
 
-from .aggregator import PrefixAggregator
-from .data_fetcher import DataFetcher
-from .lookup import (
-    IPLookup,
-    get_country_code_for_ip,
-    get_country_currency_for_ip,
-    get_country_name_for_ip,
-)
-from .output_writer import OutputWriter
-from .parser import RIRParser
-
 
 @click.group()
 @click.version_option(version="1.2.0")
@@ -31,6 +23,17 @@ def cli():
 @click.option("--data-dir", type=click.Path(), help="Custom data directory")
 def update(force, mmdb, data_dir):
     """Download and process RIR data."""
+    # The pipeline modules pull in requests, tqdm and the MMDB writer, so
+    # they are only imported by the commands that use them.
+    # pylint: disable=import-outside-toplevel
+    from concurrent.futures import ProcessPoolExecutor
+    from concurrent.futures.process import BrokenProcessPool
+
+    from .aggregator import PrefixAggregator
+    from .data_fetcher import DataFetcher
+    from .output_writer import OutputWriter
+    from .parser import RIRParser
+
     try:
         start_time = time.time()
 
@@ -43,7 +46,8 @@ def update(force, mmdb, data_dir):
 
         click.echo("\nParsing RIR files...")
         rir_files = fetcher.get_data_files()
-        all_entries = parser.parse_all_files(rir_files)
+        # One worker process per file, up to the number of CPUs.
+        all_entries = parser.parse_all_files(rir_files, processes=os.cpu_count() or 1)
 
         deduplicated_entries, conflicts = parser.deduplicate_entries(all_entries)
 
@@ -53,29 +57,48 @@ def update(force, mmdb, data_dir):
         ipv4_agg = aggregator.aggregate_entries(ipv4_entries)
         ipv6_agg = aggregator.aggregate_entries(ipv6_entries)
 
-        ipv4_agg_entries = [(p, cc) for p, cc in ipv4_agg if p.version == 4]
-        ipv6_agg_entries = [(p, cc) for p, cc in ipv6_agg if p.version == 6]
-
         click.echo("\nWriting output files...")
-        files_info = writer.write_aggregated_csv_files(
-            ipv4_agg_entries, ipv6_agg_entries
-        )
+        if mmdb and (os.cpu_count() or 1) > 1:
+            # Build the MMDB in a worker process while the CSV files are
+            # written. Prefixes are sent as (version, address, prefixlen)
+            # tuples, which pickle much more cheaply than network objects and
+            # need no formatting as text.
+            with ProcessPoolExecutor(max_workers=1) as executor:
+                mmdb_future = executor.submit(
+                    writer.write_mmdb_file,
+                    [
+                        ((4, int(prefix.network_address), prefix.prefixlen), cc)
+                        for prefix, cc in ipv4_agg
+                    ],
+                    [
+                        ((6, int(prefix.network_address), prefix.prefixlen), cc)
+                        for prefix, cc in ipv6_agg
+                    ],
+                )
+                files_info = writer.write_aggregated_csv_files(ipv4_agg, ipv6_agg)
+                files_info.update(mmdb_future.result())
+        else:
+            files_info = writer.write_aggregated_csv_files(ipv4_agg, ipv6_agg)
 
-        if mmdb:
-            mmdb_info = writer.write_mmdb_file(ipv4_agg_entries, ipv6_agg_entries)
-            files_info.update(mmdb_info)
+            if mmdb:
+                mmdb_info = writer.write_mmdb_file(ipv4_agg, ipv6_agg)
+                files_info.update(mmdb_info)
 
         writer.write_metadata(download_metadata, files_info, conflicts)
 
         click.echo("Cleaning up raw data...")
-        fetcher.cleanup_raw_data()
+        # Files with recorded validators stay so the next update can send a
+        # conditional request for them.
+        fetcher.cleanup_raw_data(keep_validated=True)
 
         elapsed = time.time() - start_time
 
         click.echo(f"\nUpdate completed in {elapsed:.1f}s")
         click.echo(f"Data directory: {fetcher.data_dir}")
 
-    except (OSError, ValueError) as e:
+    except (OSError, ValueError, BrokenProcessPool) as e:
+        # BrokenProcessPool is raised when a parser or MMDB worker process
+        # dies, e.g. because it ran out of memory.
         click.echo(f"Error: {e}", err=True)
         sys.exit(1)
 
@@ -94,6 +117,8 @@ def update(force, mmdb, data_dir):
 @click.option("--data-dir", type=click.Path(), help="Custom data directory")
 def lookup_cmd(ips, output_format, country_name, currency, data_dir):
     """Look up country information for IP addresses."""
+    from .lookup import IPLookup  # pylint: disable=import-outside-toplevel
+
     try:
         if data_dir:
             lookup_engine = IPLookup(Path(data_dir) / "processed")
@@ -101,21 +126,16 @@ def lookup_cmd(ips, output_format, country_name, currency, data_dir):
             lookup_engine = IPLookup()
 
         results = []
-        for ip in ips:
-            try:
-                result = lookup_engine.lookup_full(ip)
-                filtered_result = {
-                    "ip": result["ip"],
-                    "country_code": result["country_code"],
-                }
-                if country_name:
-                    filtered_result["country_name"] = result["country_name"]
-                if currency:
-                    filtered_result["currency"] = result["currency"]
-                results.append(filtered_result)
-            except ValueError as e:
-                click.echo(f"Error looking up {ip}: {e}", err=True)
-                continue
+        for result in lookup_engine.lookup_many(ips):
+            filtered_result = {
+                "ip": result["ip"],
+                "country_code": result["country_code"],
+            }
+            if country_name:
+                filtered_result["country_name"] = result["country_name"]
+            if currency:
+                filtered_result["currency"] = result["currency"]
+            results.append(filtered_result)
 
         _output_results(results, output_format)
 
@@ -138,10 +158,13 @@ def _output_csv(results):
     """Output results in CSV format."""
     if results:
         headers = list(results[0].keys())
-        click.echo(",".join(headers))
-        for result in results:
-            row = ",".join(str(result.get(h, "")) for h in headers)
-            click.echo(row)
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator="\n")
+        writer.writerow(headers)
+        writer.writerows(
+            [str(result.get(h, "")) for h in headers] for result in results
+        )
+        click.echo(buffer.getvalue(), nl=False)
 
 
 def _output_table(results):
@@ -151,28 +174,28 @@ def _output_table(results):
         return
 
     headers = list(results[0].keys())
-    col_widths = []
-    for h in headers:
-        max_val_len = max(len(str(result.get(h, ""))) for result in results)
-        col_widths.append(max(len(h), max_val_len))
+    rows = [[str(result.get(h, "")) for h in headers] for result in results]
+    col_widths = [
+        max(len(h), *(len(row[i]) for row in rows)) for i, h in enumerate(headers)
+    ]
 
     header_line = " | ".join(h.ljust(w) for h, w in zip(headers, col_widths))
     separator = "-+-".join("-" * w for w in col_widths)
 
-    click.echo(header_line)
-    click.echo(separator)
+    lines = [header_line, separator]
+    for row in rows:
+        lines.append(" | ".join(cell.ljust(w) for cell, w in zip(row, col_widths)))
 
-    for result in results:
-        row_line = " | ".join(
-            str(result.get(h, "")).ljust(w) for h, w in zip(headers, col_widths)
-        )
-        click.echo(row_line)
+    click.echo("\n".join(lines))
 
 
 @cli.command()
 @click.option("--data-dir", type=click.Path(), help="Custom data directory")
 def status(data_dir):
     """Show status of local data."""
+    # pylint: disable-next=import-outside-toplevel
+    from .data_fetcher import DataFetcher
+
     try:
         fetcher = DataFetcher(data_dir)
 
@@ -218,6 +241,9 @@ def status(data_dir):
 @click.argument("ip")
 def country(ip):
     """Get country name for an IP address."""
+    # pylint: disable-next=import-outside-toplevel
+    from .lookup import get_country_name_for_ip
+
     try:
         result = get_country_name_for_ip(ip)
         click.echo(result or "Unknown")
@@ -230,6 +256,9 @@ def country(ip):
 @click.argument("ip")
 def country_code_cmd(ip):
     """Get country code for an IP address."""
+    # pylint: disable-next=import-outside-toplevel
+    from .lookup import get_country_code_for_ip
+
     try:
         result = get_country_code_for_ip(ip)
         click.echo(result or "Unknown")
@@ -242,6 +271,9 @@ def country_code_cmd(ip):
 @click.argument("ip")
 def currency_cmd(ip):
     """Get currency for an IP address (shortcut)."""
+    # pylint: disable-next=import-outside-toplevel
+    from .lookup import get_country_currency_for_ip
+
     try:
         result = get_country_currency_for_ip(ip)
         click.echo(result or "Unknown")
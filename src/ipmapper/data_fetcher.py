@@ -2,9 +2,10 @@
 
 import hashlib
 import json
+import os
 import shutil
 from concurrent.futures import ThreadPoolExecutor, as_completed
-from datetime import datetime
+from datetime import date, datetime
 from pathlib import Path
 
 import requests
@@ -12,6 +13,13 @@ from requests.adapters import HTTPAdapter
 from tqdm import tqdm
 from urllib3.util import Retry
 
+from .fileio import read_mapped
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 RIR_SOURCES = {
     "apnic": [
         "https://ftp.apnic.net/stats/apnic/delegated-apnic-extended-latest",
@@ -40,12 +48,41 @@ RIR_SOURCES = {
 
 
 def calculate_sha256(filepath):
-    """Calculate SHA256 hash of a file."""
-    hash_sha256 = hashlib.sha256()
-    with open(filepath, "rb") as f:
-        for chunk in iter(lambda: f.read(4096), b""):
-            hash_sha256.update(chunk)
-    return hash_sha256.hexdigest()
+    """Calculate SHA256 hash of a file.
+
+    The file is memory-mapped and hashed in a single update() call, so the
+    whole read loop runs in C without the GIL.
+    """
+    return read_mapped(filepath, lambda data: hashlib.sha256(data).hexdigest())
+
+
+def _json_default(value):
+    """Serialize dates as ISO 8601 strings, as orjson does natively."""
+    if isinstance(value, date):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def write_json(filepath, data):
+    """Write data as indented JSON, using orjson when it is installed.
+
+    Dates are written as ISO 8601 strings by either serializer. The data is
+    written to a temporary file that then replaces the target, so readers
+    never see a partially written file.
+
+    Returns:
+        The encoded bytes that were written
+    """
+    if orjson is not None:
+        encoded = orjson.dumps(data, option=orjson.OPT_INDENT_2)
+    else:
+        encoded = json.dumps(data, indent=2, default=_json_default).encode("utf-8")
+
+    filepath = Path(filepath)
+    tmp_file = filepath.with_name(filepath.name + ".tmp")
+    tmp_file.write_bytes(encoded)
+    os.replace(tmp_file, filepath)
+    return encoded
 
 
 class DataFetcher:
@@ -55,7 +92,12 @@ class DataFetcher:
     RETRY_BACKOFF = 1.0
     TIMEOUT = (10, 60)
     MAX_WORKERS = 5
-    CHUNK_SIZE = 8192
+    CHUNK_SIZE = 1024 * 1024
+    PROGRESS_STEP = 4 * 1024 * 1024
+    # Files at least this large are fetched as parallel byte ranges. Streams
+    # per file are kept low so all concurrent downloads stay under 16.
+    RANGE_MIN_SIZE = 16 * 1024 * 1024
+    RANGE_STREAMS = 3
 
     def __init__(self, data_dir=None):
         if data_dir is None:
@@ -81,64 +123,239 @@ class DataFetcher:
         session.mount("http://", adapter)
         return session
 
-    def _download_file(self, session, url, filepath, description=None, resume=True):
-        """Download a file with progress bar, retry, and resume support."""
-        resume_header = {}
-        mode = "wb"
-        existing_size = 0
+    def _download_file(
+        self, session, url, filepath, description=None, resume=True, validators=None
+    ):
+        """Download a file with progress bar, retry, and resume support.
+
+        A full download is streamed to a temporary file that replaces filepath
+        only once it is complete, so a failed transfer leaves the current copy
+        in place.
 
-        if resume and filepath.exists():
+        Args:
+            validators: Optional dict with the "etag" and "last_modified" of
+                the copy already on disk. When given, the request is made
+                conditional and an unchanged file is not transferred again.
+
+        Returns:
+            dict: "not_modified" flag, the "etag" and "last_modified"
+            validators of a 200 or 304 response (None for any other status,
+            whose headers do not describe the local copy), and the "sha256"
+            computed while streaming (None if the download resumed an existing
+            partial file or was fetched in parallel ranges)
+        """
+        headers = {}
+        existing_size = 0
+        part_path = filepath.with_name(filepath.name + ".part")
+
+        if validators and filepath.exists():
+            if validators.get("etag"):
+                headers["If-None-Match"] = validators["etag"]
+            if validators.get("last_modified"):
+                headers["If-Modified-Since"] = validators["last_modified"]
+        elif resume and filepath.exists():
             existing_size = filepath.stat().st_size
-            resume_header = {"Range": f"bytes={existing_size}-"}
-            mode = "ab"
+            headers["Range"] = f"bytes={existing_size}-"
 
-        try:
-            response = session.get(
-                url, stream=True, headers=resume_header, timeout=self.TIMEOUT
-            )
+        info = {
+            "not_modified": False,
+            "etag": None,
+            "last_modified": None,
+            "sha256": None,
+        }
 
-            if response.status_code == 416:
-                return True
+        desc = description or f"Downloading {filepath.name}"
 
-            if response.status_code == 206:
-                total_size = existing_size + int(
-                    response.headers.get("content-length", 0)
-                )
-            elif response.status_code == 200:
-                existing_size = 0
-                mode = "wb"
-                total_size = int(response.headers.get("content-length", 0))
-            else:
-                response.raise_for_status()
-                total_size = 0
-
-            desc = description or f"Downloading {filepath.name}"
-            with (
-                open(filepath, mode) as f,
-                tqdm(
-                    desc=desc,
-                    total=total_size,
-                    initial=existing_size,
-                    unit="B",
-                    unit_scale=True,
-                    unit_divisor=1024,
-                ) as pbar,
+        try:
+            # A download that is not resumed is probed with HEAD first.
+            # Everything else, including range downloads the server refused,
+            # is fetched as a single stream.
+            if "Range" in headers or not self._download_probed(
+                session, url, filepath, headers, info, desc
             ):
-                for chunk in response.iter_content(chunk_size=self.CHUNK_SIZE):
-                    if chunk:
-                        f.write(chunk)
-                        pbar.update(len(chunk))
-
-            return True
+                self._download_stream(
+                    session, url, filepath, headers, existing_size, info, desc
+                )
+            return info
 
         except requests.exceptions.RequestException:
-            if filepath.exists() and mode == "wb":
-                filepath.unlink()
+            part_path.unlink(missing_ok=True)
             raise
 
-    def _download_single(self, session, rir_name, urls, filepath, force=False):
-        """Download a single RIR file with fallback support."""
-        if not force and filepath.exists():
+    def _download_probed(self, session, url, filepath, headers, info, desc):
+        """Check a file with a HEAD request and fetch it in ranges if large.
+
+        Probing size and range support first means a large file is never
+        opened as one stream only to be dropped.
+
+        Returns:
+            bool: True if the file is unchanged or was downloaded in ranges,
+            False if it still has to be fetched as a single stream
+        """
+        head = session.head(
+            url, headers=headers, timeout=self.TIMEOUT, allow_redirects=True
+        )
+        if head.status_code in (200, 304):
+            info["etag"] = head.headers.get("etag")
+            info["last_modified"] = head.headers.get("last-modified")
+        if head.status_code == 304:
+            info["not_modified"] = True
+            return True
+
+        part_path = filepath.with_name(filepath.name + ".part")
+        total_size = int(head.headers.get("content-length", 0))
+        if (
+            head.status_code == 200
+            and total_size >= self.RANGE_MIN_SIZE
+            and head.headers.get("accept-ranges") == "bytes"
+            and "content-encoding" not in head.headers
+            and self._download_ranges(session, url, part_path, total_size, info, desc)
+        ):
+            part_path.replace(filepath)
+            return True
+        return False
+
+    def _download_stream(
+        self, session, url, filepath, headers, existing_size, info, desc
+    ):
+        """Fetch a file as one stream, appending to it for a 206 response.
+
+        Updates info with the validators of the response, and with the
+        sha256 of the file unless the download resumed a partial file.
+        """
+        response = session.get(url, stream=True, headers=headers, timeout=self.TIMEOUT)
+
+        if response.status_code in (200, 304):
+            info["etag"] = response.headers.get("etag")
+            info["last_modified"] = response.headers.get("last-modified")
+
+        if response.status_code == 304:
+            info["not_modified"] = True
+            return
+
+        if response.status_code == 416:
+            return
+
+        part_path = filepath.with_name(filepath.name + ".part")
+        if response.status_code == 206:
+            target, mode = filepath, "ab"
+            total_size = existing_size + int(response.headers.get("content-length", 0))
+        else:
+            response.raise_for_status()
+            target, mode = part_path, "wb"
+            existing_size = 0
+            total_size = int(response.headers.get("content-length", 0))
+
+        hasher = hashlib.sha256() if mode == "wb" else None
+
+        with (
+            open(target, mode, buffering=self.CHUNK_SIZE) as f,
+            tqdm(
+                desc=desc,
+                total=total_size,
+                initial=existing_size,
+                unit="B",
+                unit_scale=True,
+                unit_divisor=1024,
+            ) as pbar,
+        ):
+            pending = 0
+            for chunk in response.iter_content(chunk_size=self.CHUNK_SIZE):
+                if chunk:
+                    f.write(chunk)
+                    if hasher is not None:
+                        hasher.update(chunk)
+                    pending += len(chunk)
+                    if pending >= self.PROGRESS_STEP:
+                        pbar.update(pending)
+                        pending = 0
+            pbar.update(pending)
+
+        if target is part_path:
+            part_path.replace(filepath)
+        if hasher is not None:
+            info["sha256"] = hasher.hexdigest()
+
+    def _download_ranges(self, session, url, filepath, total_size, info, desc):
+        """Download a file as parallel byte ranges into a preallocated file.
+
+        Returns:
+            bool: False if the server answered a range request with anything
+            but partial content, e.g. because the file changed meanwhile
+        """
+        headers = {}
+        etag = info["etag"]
+        if etag and not etag.startswith("W/"):
+            headers["If-Range"] = etag
+        elif info["last_modified"]:
+            headers["If-Range"] = info["last_modified"]
+
+        with open(filepath, "wb") as f:
+            f.truncate(total_size)
+
+        part_size = -(-total_size // self.RANGE_STREAMS)
+        with (
+            tqdm(
+                desc=desc,
+                total=total_size,
+                unit="B",
+                unit_scale=True,
+                unit_divisor=1024,
+            ) as pbar,
+            ThreadPoolExecutor(max_workers=self.RANGE_STREAMS) as executor,
+        ):
+            futures = [
+                executor.submit(
+                    self._download_range,
+                    session,
+                    url,
+                    filepath,
+                    start,
+                    min(start + part_size, total_size) - 1,
+                    headers,
+                    pbar,
+                )
+                for start in range(0, total_size, part_size)
+            ]
+            return all(future.result() for future in futures)
+
+    def _download_range(self, session, url, filepath, start, end, headers, pbar):
+        """Write bytes start..end of url to the same offset in filepath."""
+        headers = {**headers, "Range": f"bytes={start}-{end}"}
+        with session.get(
+            url, stream=True, headers=headers, timeout=self.TIMEOUT
+        ) as response:
+            if response.status_code != 206:
+                response.raise_for_status()
+                return False
+
+            with open(filepath, "r+b", buffering=self.CHUNK_SIZE) as f:
+                f.seek(start)
+                pending = 0
+                for chunk in response.iter_content(chunk_size=self.CHUNK_SIZE):
+                    f.write(chunk)
+                    pending += len(chunk)
+                    if pending >= self.PROGRESS_STEP:
+                        pbar.update(pending)
+                        pending = 0
+                pbar.update(pending)
+        return True
+
+    def _download_single(
+        self, session, rir_name, urls, filepath, force=False, validators=None
+    ):
+        """Download a single RIR file with fallback support.
+
+        An existing file that has stored validators is revalidated with a
+        conditional request and only re-downloaded if the server reports it
+        changed. Without validators, an existing file is kept. With force, the
+        full file is always transferred again.
+        """
+        if force or not (
+            validators and (validators.get("etag") or validators.get("last_modified"))
+        ):
+            validators = None
+        if not validators and not force and filepath.exists():
             return {
                 "rir": rir_name,
                 "status": "skipped",
@@ -148,14 +365,35 @@ class DataFetcher:
         last_error = None
         for try_url in urls:
             try:
-                self._download_file(
-                    session, try_url, filepath, "Downloading " + rir_name.upper()
+                info = self._download_file(
+                    session,
+                    try_url,
+                    filepath,
+                    "Downloading " + rir_name.upper(),
+                    resume=not force,
+                    validators=validators,
                 )
-                return {"rir": rir_name, "status": "success", "url": try_url}
+                if info["not_modified"]:
+                    return {
+                        "rir": rir_name,
+                        "status": "unchanged",
+                        "message": rir_name.upper() + " data is up to date",
+                        "url": try_url,
+                        "etag": info["etag"] or validators.get("etag"),
+                        "last_modified": (
+                            info["last_modified"] or validators.get("last_modified")
+                        ),
+                    }
+                return {
+                    "rir": rir_name,
+                    "status": "success",
+                    "url": try_url,
+                    "sha256": info["sha256"],
+                    "etag": info["etag"],
+                    "last_modified": info["last_modified"],
+                }
             except requests.exceptions.RequestException as e:
                 last_error = e
-                if filepath.exists():
-                    filepath.unlink()
                 continue
 
         return {
@@ -168,7 +406,9 @@ class DataFetcher:
         """Download all RIR delegated files in parallel.
 
         Args:
-            force: Force re-download even if files exist
+            force: Force re-download even if files exist. Without it, files
+                whose ETag or Last-Modified were recorded by a previous run are
+                revalidated and only transferred again if they changed.
 
         Returns:
             dict: Metadata about downloaded files
@@ -181,15 +421,26 @@ class DataFetcher:
 
         print("Downloading RIR delegated files...")
 
-        session = self._create_session()
+        previous_sources = (self.get_metadata() or {}).get("sources", {})
+
         results = {}
+        hash_futures = {}
 
-        with ThreadPoolExecutor(max_workers=self.MAX_WORKERS) as executor:
+        with (
+            self._create_session() as session,
+            ThreadPoolExecutor(max_workers=self.MAX_WORKERS) as executor,
+        ):
             futures = {}
             for rir_name, urls in RIR_SOURCES.items():
                 filepath = self.raw_dir / f"delegated-{rir_name}-extended-latest"
                 future = executor.submit(
-                    self._download_single, session, rir_name, urls, filepath, force
+                    self._download_single,
+                    session,
+                    rir_name,
+                    urls,
+                    filepath,
+                    force,
+                    previous_sources.get(rir_name),
                 )
                 futures[future] = rir_name
 
@@ -199,7 +450,7 @@ class DataFetcher:
                     result = future.result()
                     results[rir_name] = result
 
-                    if result["status"] == "skipped":
+                    if result["status"] in ("skipped", "unchanged"):
                         print("\n" + result["message"] + ", skipping...")
                     elif result["status"] == "failed":
                         print(
@@ -213,19 +464,47 @@ class DataFetcher:
                         "error": str(e),
                     }
 
+                # Files not hashed while streaming (skipped or resumed) reuse
+                # the previous hash if their size and mtime are unchanged, and
+                # are hashed here otherwise; hashlib releases the GIL, so this
+                # overlaps the remaining downloads.
+                filepath = self.raw_dir / f"delegated-{rir_name}-extended-latest"
+                if not results[rir_name].get("sha256") and filepath.exists():
+                    previous = previous_sources.get(rir_name, {})
+                    file_stat = filepath.stat()
+                    if previous.get("sha256") and (
+                        file_stat.st_size,
+                        file_stat.st_mtime_ns,
+                    ) == (previous.get("file_size"), previous.get("mtime_ns")):
+                        results[rir_name]["sha256"] = previous["sha256"]
+                    else:
+                        hash_futures[rir_name] = executor.submit(
+                            calculate_sha256, filepath
+                        )
+
         for rir_name, rir_urls in RIR_SOURCES.items():
             filepath = self.raw_dir / f"delegated-{rir_name}-extended-latest"
             if not filepath.exists():
                 continue
 
-            file_size = filepath.stat().st_size
-            file_hash = calculate_sha256(filepath)
+            file_stat = filepath.stat()
+            file_size = file_stat.st_size
+            file_hash = results[rir_name].get("sha256")
+            if file_hash is None:
+                file_hash = hash_futures[rir_name].result()
+
+            validators = results[rir_name]
+            if "etag" not in validators:
+                validators = previous_sources.get(rir_name, {})
 
             metadata["sources"][rir_name] = {
                 "url": rir_urls[0],
                 "file_path": str(filepath),
                 "file_size": file_size,
+                "mtime_ns": file_stat.st_mtime_ns,
                 "sha256": file_hash,
+                "etag": validators.get("etag"),
+                "last_modified": validators.get("last_modified"),
             }
 
             hash_preview = file_hash[:16]
@@ -234,8 +513,7 @@ class DataFetcher:
             )
 
         metadata_file = self.data_dir / "download_metadata.json"
-        with open(metadata_file, "w", encoding="utf-8") as f:
-            json.dump(metadata, f, indent=2)
+        write_json(metadata_file, metadata)
 
         print("\nAll RIR data downloaded successfully")
         print("Data stored in: " + str(self.data_dir))
@@ -260,15 +538,51 @@ class DataFetcher:
         """Get download metadata if available."""
         metadata_file = self.data_dir / "download_metadata.json"
         if metadata_file.exists():
-            with open(metadata_file, encoding="utf-8") as f:
-                return json.load(f)
+            # A truncated or corrupt file is treated as missing, so the next
+            # update downloads everything again instead of failing.
+            try:
+                with open(metadata_file, encoding="utf-8") as f:
+                    metadata = json.load(f)
+            except ValueError:
+                return None
+            if isinstance(metadata, dict):
+                return metadata
         return None
 
-    def cleanup_raw_data(self):
-        """Remove raw data directory to save space."""
-        if self.raw_dir.exists():
-            try:
+    def cleanup_raw_data(self, keep_validated=False):
+        """Remove raw data directory to save space.
+
+        Args:
+            keep_validated: Keep the files that have an ETag or Last-Modified
+                recorded in the download metadata, so the next update can
+                revalidate them instead of downloading them again.
+        """
+        if not self.raw_dir.exists():
+            return
+
+        keep = set()
+        if keep_validated:
+            sources = (self.get_metadata() or {}).get("sources", {})
+            keep = {
+                f"delegated-{rir_name}-extended-latest"
+                for rir_name, source in sources.items()
+                if source.get("etag") or source.get("last_modified")
+            }
+
+        try:
+            if not keep:
                 shutil.rmtree(self.raw_dir)
                 print("Cleaned up raw data directory: " + str(self.raw_dir))
-            except OSError as e:
-                print("Warning: Failed to cleanup raw data: " + str(e))
+                return
+
+            for path in self.raw_dir.iterdir():
+                if path.name not in keep:
+                    path.unlink()
+            print(
+                "Cleaned up raw data directory, kept "
+                + str(len(keep))
+                + " files for revalidation: "
+                + str(self.raw_dir)
+            )
+        except OSError as e:
+            print("Warning: Failed to cleanup raw data: " + str(e))
@@ -0,0 +1,23 @@
+"""Memory-mapped file reading shared by the RIR parser and the data fetcher."""
+
+import mmap
+
+
+def read_mapped(filepath, consume):
+    """Pass the contents of a file to consume without copying them.
+
+    The file is memory-mapped and consume receives the mapping, so hashing
+    or decoding reads straight from the page cache. Files that cannot be
+    mapped are read into a bytes object instead.
+
+    Returns:
+        Whatever consume returns
+    """
+    with open(filepath, "rb") as f:
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            # Raised for empty files and for files that are not mappable.
+            return consume(f.read())
+        with mm:
+            return consume(mm)
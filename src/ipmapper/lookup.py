@@ -1,51 +1,131 @@
-"""Fast IP lookup using radix trees."""
+"""Fast IP lookup using binary search over flattened prefix ranges."""
 
-import csv
+import bisect
 import ipaddress
 import json
+import os
+import socket
+import struct
+import sys
+from array import array
 from pathlib import Path
 
 from .countries import get_country_info
-
-
-class RadixNode:
-    """Node in a radix tree for IP prefix lookups."""
-
-    def __init__(self):
-        self.children = {}
-        self.data = None
-        self.is_terminal = False
-
-    def insert(self, prefix_bits, country_code, depth=0):
-        """Insert a prefix into the radix tree."""
-        if depth == len(prefix_bits):
-            self.data = country_code
-            self.is_terminal = True
+from .netparse import parse_network
+
+# Binary cache of the built lookup structures, stored next to the CSV files.
+CACHE_FILE = "lookup_cache.bin"
+_CACHE_MAGIC = b"IPMC"
+_CACHE_VERSION = 1
+# Magic, format version, big-endian flag, then size and mtime_ns of the
+# IPv4 and IPv6 CSV files the cache was built from.
+_CACHE_HEADER = struct.Struct("<4sHH4q")
+
+
+def _build_ranges(prefix_ranges, width):
+    """Flatten possibly nested prefixes into disjoint ranges for binary search.
+
+    Args:
+        prefix_ranges: List of (start, end, country_code) tuples with an
+            exclusive end. Where prefixes overlap the more specific one wins,
+            and among identical prefixes the last one wins.
+        width: Address width in bits. The end of a range reaching the top of
+            the address space is not emitted, since no address lies past it.
+
+    Returns:
+        Tuple of (starts, country_codes) lists: country_codes[i] covers
+        addresses from starts[i] up to starts[i + 1], None marks addresses
+        without an allocation.
+    """
+    starts = [0]
+    country_codes = [None]
+    limit = 1 << width
+
+    def emit(start, country_code):
+        if start >= limit:
             return
+        if starts[-1] == start:
+            starts.pop()
+            country_codes.pop()
+        if not country_codes or country_codes[-1] != country_code:
+            starts.append(start)
+            country_codes.append(country_code)
+
+    # Sorting on (start, -end) puts enclosing prefixes before nested ones.
+    open_ranges = []
+    for start, end, country_code in sorted(prefix_ranges, key=lambda r: (r[0], -r[1])):
+        while open_ranges and open_ranges[-1][0] <= start:
+            closed_end = open_ranges.pop()[0]
+            emit(closed_end, open_ranges[-1][1] if open_ranges else None)
+        emit(start, country_code)
+        open_ranges.append((end, country_code))
+
+    while open_ranges:
+        closed_end = open_ranges.pop()[0]
+        emit(closed_end, open_ranges[-1][1] if open_ranges else None)
+
+    return starts, country_codes
+
+
+def _pack_sections(sections):
+    """Concatenate byte strings, each preceded by its 8-byte length."""
+    return b"".join(len(data).to_bytes(8, "little") + data for data in sections)
+
+
+def _unpack_sections(data, offset):
+    """Yield the sections of data packed by _pack_sections, from offset on."""
+    while offset < len(data):
+        size = int.from_bytes(data[offset : offset + 8], "little")
+        offset += 8
+        if offset + size > len(data):
+            raise ValueError("Truncated lookup cache")
+        yield data[offset : offset + size]
+        offset += size
+
+
+def _array_list(typecode, data):
+    """Decode native-endian array bytes into a list."""
+    values = array(typecode)
+    values.frombytes(data)
+    return values.tolist()
+
+
+def _read_prefix_csv(path):
+    """Return the (prefix, country_code) rows of an aggregated prefix CSV.
+
+    The writer never quotes fields, so the file is read in one call and
+    split on commas instead of going through the csv module row by row.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        lines = f.read().splitlines()
+    return [row[:2] for row in (line.split(",") for line in lines) if len(row) >= 2]
+
+
+def _parse_address(ip):
+    """Parse an IP address into its integer value and version.
+
+    Plain address strings go through inet_pton; anything it rejects, such as
+    scoped IPv6 addresses or address objects, falls back to ipaddress.
+
+    Raises:
+        ValueError: If ip is not a valid IPv4 or IPv6 address
+    """
+    if isinstance(ip, str):
+        if ":" in ip:
+            family, version = socket.AF_INET6, 6
+        else:
+            family, version = socket.AF_INET, 4
+        try:
+            return int.from_bytes(socket.inet_pton(family, ip), "big"), version
+        except OSError:
+            pass
 
-        bit = prefix_bits[depth]
-        if bit not in self.children:
-            self.children[bit] = RadixNode()
-
-        self.children[bit].insert(prefix_bits, country_code, depth + 1)
-
-    def lookup(self, ip_bits, depth=0):
-        """Look up an IP address in the radix tree."""
-        best_match = self.data if self.is_terminal else None
-
-        if depth >= len(ip_bits) or not self.children:
-            return best_match
-
-        bit = ip_bits[depth]
-        if bit in self.children:
-            child_result = self.children[bit].lookup(ip_bits, depth + 1)
-            return child_result if child_result is not None else best_match
-
-        return best_match
+    ip_obj = ipaddress.ip_address(ip)
+    return int(ip_obj), ip_obj.version
 
 
 class IPLookup:
-    """Fast IP-to-country lookup using radix trees."""
+    """Fast IP-to-country lookup over flattened IPv4 and IPv6 prefix ranges."""
 
     def __init__(self, data_dir=None):
         """Initialize the IP lookup system.
@@ -57,41 +137,14 @@ class IPLookup:
             data_dir = Path.home() / ".ipmapper" / "processed"
 
         self.data_dir = Path(data_dir)
-        self.ipv4_tree = RadixNode()
-        self.ipv6_tree = RadixNode()
+        self.ipv4_ranges = None
+        self.ipv6_ranges = None
         self.metadata = {}
+        self.country_info = {}
         self.loaded = False
 
-    def _ip_to_bits(self, ip):
-        """Convert IP address to binary string."""
-        if isinstance(ip, str):
-            try:
-                ip = ipaddress.ip_address(ip)
-            except ValueError as exc:
-                raise ValueError(f"Invalid IP address: {ip}") from exc
-
-        if isinstance(ip, ipaddress.IPv4Address):
-            return format(int(ip), "032b")
-        if isinstance(ip, ipaddress.IPv6Address):
-            return format(int(ip), "0128b")
-        raise ValueError(f"Unsupported IP type: {type(ip)}")
-
-    def _prefix_to_bits(self, prefix):
-        """Convert IP prefix to binary string of the network portion."""
-        if isinstance(prefix, str):
-            prefix = ipaddress.ip_network(prefix)
-
-        network_int = int(prefix.network_address)
-        if isinstance(prefix, ipaddress.IPv4Network):
-            total_bits = 32
-        else:
-            total_bits = 128
-
-        binary = format(network_int, f"0{total_bits}b")
-        return binary[: prefix.prefixlen]
-
     def load_data(self):
-        """Load processed data into radix trees."""
+        """Load processed data into the lookup structures."""
         ipv4_file = self.data_dir / "prefixes_ipv4_agg.csv"
         ipv6_file = self.data_dir / "prefixes_ipv6_agg.csv"
         metadata_file = self.data_dir / "metadata.json"
@@ -107,39 +160,140 @@ class IPLookup:
             with open(metadata_file, encoding="utf-8") as f:
                 self.metadata = json.load(f)
 
-        self._load_ipv4_data(ipv4_file)
-        self._load_ipv6_data(ipv6_file)
+        ipv4_stat = ipv4_file.stat()
+        ipv6_stat = ipv6_file.stat()
+        cache_key = (
+            ipv4_stat.st_size,
+            ipv4_stat.st_mtime_ns,
+            ipv6_stat.st_size,
+            ipv6_stat.st_mtime_ns,
+        )
+
+        if not self._load_cache(cache_key):
+            self.ipv4_ranges = _build_ranges(self._load_ipv4_data(ipv4_file), 32)
+            self.ipv6_ranges = _build_ranges(self._load_ipv6_data(ipv6_file), 128)
+            self._save_cache(cache_key)
 
         self.loaded = True
         return True
 
+    def _load_cache(self, cache_key):
+        """Restore the IPv4 and IPv6 ranges from the binary cache.
+
+        Returns:
+            bool: False if the cache is missing, stale or unreadable
+        """
+        try:
+            data = (self.data_dir / CACHE_FILE).read_bytes()
+            magic, version, big_endian, *key = _CACHE_HEADER.unpack_from(data)
+            if (magic, version, big_endian, tuple(key)) != (
+                _CACHE_MAGIC,
+                _CACHE_VERSION,
+                sys.byteorder == "big",
+                cache_key,
+            ):
+                return False
+
+            sections = list(_unpack_sections(data, _CACHE_HEADER.size))
+            if len(sections) != 5:
+                return False
+            (
+                codes_data,
+                ipv4_starts_data,
+                ipv4_codes_data,
+                ipv6_starts_data,
+                ipv6_codes_data,
+            ) = sections
+
+            # Index 0 stands for "no country".
+            codes = [None] + codes_data.decode("utf-8").split("\n")
+            ipv4_ranges = (
+                _array_list("Q", ipv4_starts_data),
+                [codes[i] for i in _array_list("H", ipv4_codes_data)],
+            )
+            # IPv6 starts do not fit an array typecode and are stored as
+            # 16-byte big-endian integers.
+            ipv6_ranges = (
+                [
+                    int.from_bytes(ipv6_starts_data[i : i + 16], "big")
+                    for i in range(0, len(ipv6_starts_data), 16)
+                ],
+                [codes[i] for i in _array_list("H", ipv6_codes_data)],
+            )
+        except (OSError, ValueError, IndexError, struct.error):
+            return False
+
+        for starts, country_codes in (ipv4_ranges, ipv6_ranges):
+            if len(starts) != len(country_codes):
+                return False
+
+        self.ipv4_ranges = ipv4_ranges
+        self.ipv6_ranges = ipv6_ranges
+        return True
+
+    def _save_cache(self, cache_key):
+        """Write the IPv4 and IPv6 ranges to the binary cache."""
+        ipv4_starts, ipv4_codes = self.ipv4_ranges
+        ipv6_starts, ipv6_codes = self.ipv6_ranges
+        codes = sorted({cc for cc in ipv4_codes + ipv6_codes if cc is not None})
+        index = {cc: i for i, cc in enumerate(codes, 1)}
+        index[None] = 0
+
+        # The cache is only an optimization, so a read-only data directory or
+        # ranges the format cannot hold just mean the CSV files are parsed
+        # again next time.
+        cache_file = self.data_dir / CACHE_FILE
+        tmp_file = cache_file.with_name(cache_file.name + ".tmp")
+        try:
+            data = _CACHE_HEADER.pack(
+                _CACHE_MAGIC, _CACHE_VERSION, sys.byteorder == "big", *cache_key
+            ) + _pack_sections(
+                [
+                    "\n".join(codes).encode("utf-8"),
+                    array("Q", ipv4_starts).tobytes(),
+                    array("H", [index[cc] for cc in ipv4_codes]).tobytes(),
+                    b"".join(start.to_bytes(16, "big") for start in ipv6_starts),
+                    array("H", [index[cc] for cc in ipv6_codes]).tobytes(),
+                ]
+            )
+            tmp_file.write_bytes(data)
+            os.replace(tmp_file, cache_file)
+        except (OSError, OverflowError, ValueError, struct.error):
+            pass
+
     def _load_ipv4_data(self, ipv4_file):
-        """Load IPv4 prefix data from CSV file."""
-        with open(ipv4_file, "r", encoding="utf-8") as f:
-            reader = csv.reader(f)
-            for row in reader:
-                if len(row) >= 2:
-                    prefix_str, country_code = row[0], row[1]
-                    try:
-                        prefix = ipaddress.IPv4Network(prefix_str)
-                        prefix_bits = self._prefix_to_bits(prefix)
-                        self.ipv4_tree.insert(prefix_bits, country_code.upper())
-                    except (ValueError, TypeError) as e:
-                        print(f"Warning: Failed to load IPv4 {prefix_str}: {e}")
+        """Load IPv4 prefix data from CSV file.
+
+        Returns:
+            List of (start, end, country_code) tuples
+        """
+        prefixes = []
+        for prefix_str, country_code in _read_prefix_csv(ipv4_file):
+            try:
+                start, prefixlen = parse_network(prefix_str, 4)
+                prefixes.append(
+                    (start, start + (1 << (32 - prefixlen)), country_code.upper())
+                )
+            except (ValueError, TypeError) as e:
+                print(f"Warning: Failed to load IPv4 {prefix_str}: {e}")
+        return prefixes
 
     def _load_ipv6_data(self, ipv6_file):
-        """Load IPv6 prefix data from CSV file."""
-        with open(ipv6_file, "r", encoding="utf-8") as f:
-            reader = csv.reader(f)
-            for row in reader:
-                if len(row) >= 2:
-                    prefix_str, country_code = row[0], row[1]
-                    try:
-                        prefix = ipaddress.IPv6Network(prefix_str)
-                        prefix_bits = self._prefix_to_bits(prefix)
-                        self.ipv6_tree.insert(prefix_bits, country_code.upper())
-                    except (ValueError, TypeError) as e:
-                        print(f"Warning: Failed to load IPv6 {prefix_str}: {e}")
+        """Load IPv6 prefix data from CSV file.
+
+        Returns:
+            List of (start, end, country_code) tuples
+        """
+        prefixes = []
+        for prefix_str, country_code in _read_prefix_csv(ipv6_file):
+            try:
+                start, prefixlen = parse_network(prefix_str, 6)
+                prefixes.append(
+                    (start, start + (1 << (128 - prefixlen)), country_code.upper())
+                )
+            except (ValueError, TypeError) as e:
+                print(f"Warning: Failed to load IPv6 {prefix_str}: {e}")
+        return prefixes
 
     def lookup_ip(self, ip, ip_version=None):
         """Look up country code for an IP address."""
@@ -148,35 +302,79 @@ class IPLookup:
                 return None
 
         try:
-            ip_obj = ipaddress.ip_address(ip)
+            address, version = _parse_address(ip)
         except ValueError:
             print(f"Invalid IP address: {ip}")
             return None
 
-        ip_bits = self._ip_to_bits(ip_obj)
+        if ip_version is None:
+            ip_version = "ipv4" if version == 4 else "ipv6"
+
+        width = 32 if version == 4 else 128
+
+        # A version hint that disagrees with the address matches its leading
+        # bits against the other family's prefixes.
+        if ip_version == "ipv4":
+            starts, country_codes = self.ipv4_ranges
+            address >>= width - 32
+        elif ip_version == "ipv6":
+            starts, country_codes = self.ipv6_ranges
+            address <<= 128 - width
+        else:
+            print(f"Invalid IP version hint: {ip_version}")
+            return None
 
-        if ip_version == "ipv4" or (
-            ip_version is None and isinstance(ip_obj, ipaddress.IPv4Address)
-        ):
-            return self.ipv4_tree.lookup(ip_bits)
-        if ip_version == "ipv6" or (
-            ip_version is None and isinstance(ip_obj, ipaddress.IPv6Address)
-        ):
-            return self.ipv6_tree.lookup(ip_bits)
+        return country_codes[bisect.bisect_right(starts, address) - 1]
 
-        print(f"Invalid IP version hint: {ip_version}")
-        return None
+    def lookup_many(self, ips):
+        """Look up complete information for a batch of IP addresses.
+
+        Each address is resolved by binary search over the same flattened,
+        disjoint prefix ranges lookup_ip uses.
+
+        Returns:
+            List of result dicts in the same order and format as lookup_full
+        """
+        if not self.loaded:
+            if not self.load_data():
+                return [self._build_result(ip, None) for ip in ips]
+
+        results = []
+        for ip in ips:
+            try:
+                address, version = _parse_address(ip)
+            except ValueError:
+                print(f"Invalid IP address: {ip}")
+                results.append(self._build_result(ip, None))
+                continue
+
+            starts, country_codes = (
+                self.ipv4_ranges if version == 4 else self.ipv6_ranges
+            )
+            index = bisect.bisect_right(starts, address) - 1
+            results.append(self._build_result(ip, country_codes[index]))
+
+        return results
 
     def lookup_full(self, ip, ip_version=None):
         """Look up complete information for an IP address."""
-        cc = self.lookup_ip(ip, ip_version)
+        return self._build_result(ip, self.lookup_ip(ip, ip_version))
+
+    def _build_result(self, ip, cc):
+        """Build the result dict for a looked up country code."""
         if cc:
-            country_info = get_country_info(cc)
+            # Only a few hundred codes exist, so their name and currency are
+            # resolved once per code.
+            info = self.country_info.get(cc)
+            if info is None:
+                country_info = get_country_info(cc)
+                info = (country_info["name"], country_info["currency"])
+                self.country_info[cc] = info
             return {
                 "ip": str(ip),
                 "country_code": cc,
-                "country_name": country_info["name"],
-                "currency": country_info["currency"],
+                "country_name": info[0],
+                "currency": info[1],
             }
         return {
             "ip": str(ip),
@@ -202,6 +400,11 @@ def lookup(ip, ip_version=None):
     return get_lookup().lookup_full(ip, ip_version)
 
 
+def lookup_batch(ips):
+    """Look up a batch of IPv4 and IPv6 addresses in one call."""
+    return get_lookup().lookup_many(ips)
+
+
 def get_country_name_for_ip(ip, ip_version=None):
     """Get country name for an IP address."""
     result = get_lookup().lookup_full(ip, ip_version)
@@ -0,0 +1,35 @@
+"""CIDR parsing shared by the RIR parser and the lookup engine."""
+
+import ipaddress
+import socket
+
+_NETWORK_TYPES = {
+    4: (socket.AF_INET, 32, ipaddress.IPv4Network),
+    6: (socket.AF_INET6, 128, ipaddress.IPv6Network),
+}
+
+
+def parse_network(prefix_str, version):
+    """Parse a CIDR string into its network address integer and prefix length.
+
+    Plain "address/length" strings go through inet_pton; anything else is
+    left to ipaddress, so the accepted inputs and the errors raised are those
+    of the ipaddress network classes.
+
+    Raises:
+        ValueError: If prefix_str is not a valid network of that version
+    """
+    family, width, network_cls = _NETWORK_TYPES[version]
+    address, _, prefixlen = prefix_str.partition("/")
+    if prefixlen.isascii() and prefixlen.isdigit():
+        try:
+            start = int.from_bytes(socket.inet_pton(family, address), "big")
+        except (OSError, ValueError):
+            pass
+        else:
+            prefixlen = int(prefixlen)
+            if prefixlen <= width and not start & ((1 << (width - prefixlen)) - 1):
+                return start, prefixlen
+
+    network = network_cls(prefix_str)
+    return int(network.network_address), network.prefixlen
@@ -1,14 +1,71 @@
 """Output writer for generating CSV and MMDB files."""
 
-import csv
-import json
+import hashlib
 from datetime import datetime
+from ipaddress import IPv4Network
+from itertools import groupby, starmap, tee
+from operator import itemgetter, le
 from pathlib import Path
 
 from mmdb_writer import MMDBWriter
-from netaddr import IPSet
+from netaddr import IPNetwork, IPSet
 
-from .data_fetcher import calculate_sha256
+from .data_fetcher import calculate_sha256, write_json
+
+
+def _network_key(entry):
+    """Sort key for (prefix, cc) entries by network address.
+
+    Integers compare in C, unlike address objects whose ordering goes
+    through Python-level comparison methods.
+    """
+    return int(entry[0].network_address)
+
+
+def _in_network_order(entries):
+    """Check whether (prefix, cc) entries are already sorted by network address.
+
+    Compares neighbouring keys in one lazy pass, without building a key list.
+    """
+    keys, next_keys = tee(map(_network_key, entries))
+    next(next_keys, None)
+    return all(map(le, keys, next_keys))
+
+
+# Decimal text of every octet value, for formatting dotted quads by lookup.
+_OCTETS = [str(octet) for octet in range(256)]
+
+
+def _csv_row(prefix, cc):
+    """Format one CSV row.
+
+    IPv4 addresses are formatted from their integer value with the octet
+    table, which skips the chain of Python-level calls behind str() on an
+    IPv4Network.
+    """
+    if isinstance(prefix, IPv4Network):
+        addr = int(prefix.network_address)
+        return (
+            f"{_OCTETS[addr >> 24]}.{_OCTETS[addr >> 16 & 255]}."
+            f"{_OCTETS[addr >> 8 & 255]}.{_OCTETS[addr & 255]}"
+            f"/{prefix.prefixlen},{cc}\r\n"
+        )
+    return f"{prefix},{cc}\r\n"
+
+
+def _mmdb_network(prefix):
+    """Convert a prefix to a netaddr network without formatting it as text.
+
+    Accepts ipaddress networks as well as the (version, address, prefixlen)
+    tuples that the update command sends to its MMDB worker process.
+    """
+    if isinstance(prefix, tuple):
+        version, address, prefixlen = prefix
+    else:
+        version = prefix.version
+        address = int(prefix.network_address)
+        prefixlen = prefix.prefixlen
+    return IPNetwork((address, prefixlen), version=version)
 
 
 class OutputWriter:
@@ -23,6 +80,25 @@ class OutputWriter:
         self.output_dir = Path(output_dir)
         self.output_dir.mkdir(exist_ok=True)
 
+    def _write_prefix_csv(self, path, entries):
+        """Write (prefix, cc) rows sorted by network address.
+
+        Prefixes and country codes never need CSV quoting, so the rows are
+        joined into one buffer and written with a single call. The buffer is
+        hashed directly instead of reading the file back.
+
+        Returns:
+            Tuple of (size in bytes, SHA256 hex digest) of the written file
+        """
+        # Aggregator output already comes in network order; only sort a copy
+        # of entries that do not.
+        rows = (
+            entries if _in_network_order(entries) else sorted(entries, key=_network_key)
+        )
+        data = "".join(starmap(_csv_row, rows)).encode("utf-8")
+        path.write_bytes(data)
+        return len(data), hashlib.sha256(data).hexdigest()
+
     def write_aggregated_csv_files(self, ipv4_agg_entries, ipv6_agg_entries):
         """Write only aggregated CSV files for performance."""
         print("Writing aggregated CSV files...")
@@ -30,32 +106,22 @@ class OutputWriter:
         files_info = {}
 
         ipv4_agg_file = self.output_dir / "prefixes_ipv4_agg.csv"
-        with open(ipv4_agg_file, "w", newline="", encoding="utf-8") as f:
-            writer = csv.writer(f)
-            for prefix, cc in sorted(
-                ipv4_agg_entries, key=lambda x: x[0].network_address
-            ):
-                writer.writerow([str(prefix), cc])
+        size, sha256 = self._write_prefix_csv(ipv4_agg_file, ipv4_agg_entries)
 
         files_info["prefixes_ipv4_agg.csv"] = {
             "path": str(ipv4_agg_file),
-            "size": ipv4_agg_file.stat().st_size,
-            "sha256": calculate_sha256(ipv4_agg_file),
+            "size": size,
+            "sha256": sha256,
             "count": len(ipv4_agg_entries),
         }
 
         ipv6_agg_file = self.output_dir / "prefixes_ipv6_agg.csv"
-        with open(ipv6_agg_file, "w", newline="", encoding="utf-8") as f:
-            writer = csv.writer(f)
-            for prefix, cc in sorted(
-                ipv6_agg_entries, key=lambda x: x[0].network_address
-            ):
-                writer.writerow([str(prefix), cc])
+        size, sha256 = self._write_prefix_csv(ipv6_agg_file, ipv6_agg_entries)
 
         files_info["prefixes_ipv6_agg.csv"] = {
             "path": str(ipv6_agg_file),
-            "size": ipv6_agg_file.stat().st_size,
-            "sha256": calculate_sha256(ipv6_agg_file),
+            "size": size,
+            "sha256": sha256,
             "count": len(ipv6_agg_entries),
         }
 
@@ -65,7 +131,11 @@ class OutputWriter:
         return files_info
 
     def write_mmdb_file(self, ipv4_agg_entries, ipv6_agg_entries):
-        """Write MMDB binary file for IP-to-country lookups."""
+        """Write MMDB binary file for IP-to-country lookups.
+
+        Entries are (prefix, cc) pairs, with each prefix given as an ipaddress
+        network or a (version, address, prefixlen) tuple.
+        """
         print("Writing MMDB file...")
 
         mmdb_file = self.output_dir / "country.mmdb"
@@ -79,21 +149,17 @@ class OutputWriter:
 
         total_entries = 0
 
-        for prefix, country_code in ipv4_agg_entries:
-            network = IPSet([str(prefix)])
-            writer.insert_network(
-                network,
-                {"country": {"iso_code": country_code}},
-            )
-            total_entries += 1
-
-        for prefix, country_code in ipv6_agg_entries:
-            network = IPSet([str(prefix)])
-            writer.insert_network(
-                network,
-                {"country": {"iso_code": country_code}},
-            )
-            total_entries += 1
+        # Later inserts override overlapping earlier ones, so only consecutive
+        # entries of the same country are combined into one IPSet; grouping
+        # all of a country's prefixes would change which overlap wins.
+        for entries in (ipv4_agg_entries, ipv6_agg_entries):
+            for country_code, run in groupby(entries, key=itemgetter(1)):
+                prefixes = [_mmdb_network(prefix) for prefix, _ in run]
+                writer.insert_network(
+                    IPSet(prefixes),
+                    {"country": {"iso_code": country_code}},
+                )
+                total_entries += len(prefixes)
 
         writer.to_db_file(str(mmdb_file))
 
@@ -108,40 +174,6 @@ class OutputWriter:
             }
         }
 
-    def _serialize_conflicts(self, conflicts):
-        """Convert datetime.date objects to ISO strings for JSON serialization."""
-        if not conflicts:
-            return []
-        serialized = []
-        for conflict in conflicts:
-            serialized.append(
-                {
-                    "prefix": conflict["prefix"],
-                    "entries": [
-                        (
-                            reg,
-                            cc,
-                            (
-                                date.isoformat()
-                                if hasattr(date, "isoformat")
-                                else str(date)
-                            ),
-                        )
-                        for reg, cc, date in conflict["entries"]
-                    ],
-                    "chosen": (
-                        conflict["chosen"][0],
-                        conflict["chosen"][1],
-                        (
-                            conflict["chosen"][2].isoformat()
-                            if hasattr(conflict["chosen"][2], "isoformat")
-                            else str(conflict["chosen"][2])
-                        ),
-                    ),
-                }
-            )
-        return serialized
-
     def write_metadata(self, download_metadata, files_info, conflicts=None):
         """Write metadata JSON file."""
         print("Writing metadata...")
@@ -166,7 +198,9 @@ class OutputWriter:
                     "prefixes_ipv6_agg.csv", {}
                 ).get("count", 0),
             },
-            "conflicts": self._serialize_conflicts(conflicts),
+            # Conflict dates are datetime.date objects; write_json emits them
+            # as ISO strings.
+            "conflicts": conflicts or [],
             "usage_note": (
                 "This dataset is derived from public RIR delegated files "
                 "and inherits their usage terms."
@@ -176,13 +210,12 @@ class OutputWriter:
         metadata["note"] = "Only aggregated prefixes are stored for optimal performance"
 
         metadata_file = self.output_dir / "metadata.json"
-        with open(metadata_file, "w", encoding="utf-8") as f:
-            json.dump(metadata, f, indent=2)
+        encoded = write_json(metadata_file, metadata)
 
         files_info["metadata.json"] = {
             "path": str(metadata_file),
-            "size": metadata_file.stat().st_size,
-            "sha256": calculate_sha256(metadata_file),
+            "size": len(encoded),
+            "sha256": hashlib.sha256(encoded).hexdigest(),
             "count": 1,
         }
 
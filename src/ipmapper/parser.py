@@ -1,49 +1,81 @@
 """Parser for RIR delegated files."""
 
 import ipaddress
+import sys
 import warnings
 from collections import defaultdict, namedtuple
-from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime
 
+from .fileio import read_mapped
+from .netparse import parse_network
+
+# prefix is a (version, network address, prefix length) tuple of ints; network
+# objects are only built for the aggregated output.
 RIREntry = namedtuple(
     "RIREntry", ["registry", "cc", "type", "start", "value", "date", "status", "prefix"]
 )
 
 
+def _format_prefix(prefix):
+    """Format a (version, address, prefixlen) tuple as CIDR text."""
+    version, addr, prefixlen = prefix
+    if version == 4:
+        return str(ipaddress.IPv4Network((addr, prefixlen)))
+    return str(ipaddress.IPv6Network((addr, prefixlen)))
+
+
+def _read_text(filepath):
+    """Read a file as UTF-8 text, dropping bytes that do not decode.
+
+    The file is memory-mapped and decoded straight from the mapping, which
+    skips the copy into an intermediate bytes object.
+    """
+    return read_mapped(filepath, lambda data: str(data, "utf-8", "ignore"))
+
+
 class RIRParser:
     """Parser for RIR delegated extended files."""
 
     def __init__(self):
         self.valid_statuses = {"allocated", "assigned"}
         self.valid_types = {"ipv4", "ipv6"}
+        # Delegated files repeat a few hundred country codes and a few
+        # thousand dates across all of their lines; parse each one once.
+        self._cc_cache = {}
+        self._date_cache = {}
 
     def _ipv4_to_cidrs(self, start_ip, count):
-        """Convert IPv4 start address and count to CIDR blocks."""
-        try:
-            start = ipaddress.IPv4Address(start_ip)
-            start_int = int(start)
-            end_int = start_int + count - 1
+        """Convert IPv4 start address and count to CIDR blocks.
 
-            cidrs = []
-            current = start_int
+        Works on integers throughout: each block is the largest power of two
+        that is both aligned at the current address and fits in the remaining
+        count.
 
-            while current <= end_int:
-                max_block_size = 1
-                while (
-                    current % (max_block_size * 2) == 0
-                    and current + max_block_size * 2 - 1 <= end_int
-                ):
-                    max_block_size *= 2
+        Returns:
+            List of (4, network address, prefix length) tuples
+        """
+        try:
+            current = int(ipaddress.IPv4Address(start_ip))
+            end_int = current + count
+            if end_int > 1 << 32:
+                raise ValueError("range extends past 255.255.255.255")
 
-                prefix_len = 32 - (max_block_size - 1).bit_length()
-                if max_block_size == 1:
-                    prefix_len = 32
+            # Most delegations are a single block: a power-of-two count
+            # starting at an address aligned to it.
+            if count > 0 and count & (count - 1) == 0 and current & (count - 1) == 0:
+                return [(4, current, 33 - count.bit_length())]
 
-                cidr = ipaddress.IPv4Network(
-                    f"{ipaddress.IPv4Address(current)}/{prefix_len}"
-                )
-                cidrs.append(cidr)
-                current += max_block_size
+            cidrs = []
+            while current < end_int:
+                # current & -current isolates the lowest set bit (the
+                # alignment); address 0 is aligned to the whole space.
+                alignment = current & -current if current else 1 << 32
+                block_size = min(alignment, 1 << ((end_int - current).bit_length() - 1))
+                prefix_len = 33 - block_size.bit_length()
+
+                cidrs.append((4, current, prefix_len))
+                current += block_size
 
             return cidrs
 
@@ -54,13 +86,30 @@ class RIRParser:
             return []
 
     def _parse_date(self, date_field):
-        """Parse date field from RIR file."""
-        try:
-            if date_field and date_field.isdigit():
-                return datetime.strptime(date_field, "%Y%m%d").date()
-            return datetime(1900, 1, 1).date()
-        except ValueError:
-            return datetime(1900, 1, 1).date()
+        """Parse date field from RIR file.
+
+        Dates are almost always YYYYMMDD, which is sliced into integers
+        directly; strptime is left for any other all-digit field.
+        """
+        parsed = self._date_cache.get(date_field)
+        if parsed is None:
+            try:
+                if (
+                    len(date_field) == 8
+                    and date_field.isascii()
+                    and date_field.isdigit()
+                ):
+                    parsed = date(
+                        int(date_field[:4]), int(date_field[4:6]), int(date_field[6:])
+                    )
+                elif date_field and date_field.isdigit():
+                    parsed = datetime.strptime(date_field, "%Y%m%d").date()
+                else:
+                    parsed = date(1900, 1, 1)
+            except ValueError:
+                parsed = date(1900, 1, 1)
+            self._date_cache[date_field] = parsed
+        return parsed
 
     def _parse_line(self, line, registry):
         """Parse a single line from RIR file."""
@@ -78,7 +127,11 @@ class RIRParser:
         if type_field not in self.valid_types or status not in self.valid_statuses:
             return None
 
-        date = self._parse_date(date_field)
+        entry_date = self._parse_date(date_field)
+
+        upper_cc = self._cc_cache.get(cc)
+        if upper_cc is None:
+            upper_cc = self._cc_cache[cc] = sys.intern(cc.upper())
 
         prefixes = []
         if type_field == "ipv4":
@@ -94,8 +147,8 @@ class RIRParser:
         elif type_field == "ipv6":
             try:
                 prefix_len = int(value)
-                prefix = ipaddress.IPv6Network(f"{start}/{prefix_len}")
-                prefixes = [prefix]
+                addr, prefix_len = parse_network(f"{start}/{prefix_len}", 6)
+                prefixes = [(6, addr, prefix_len)]
             except ValueError as e:
                 warnings.warn(
                     "Failed to parse IPv6 " + start + "/" + value + ": " + str(e)
@@ -106,11 +159,11 @@ class RIRParser:
         for prefix in prefixes:
             entry = RIREntry(
                 registry=registry,
-                cc=cc.upper(),
+                cc=upper_cc,
                 type=type_field,
                 start=start,
                 value=value,
-                date=date,
+                date=entry_date,
                 status=status,
                 prefix=prefix,
             )
@@ -119,43 +172,66 @@ class RIRParser:
         return entries
 
     def parse_file(self, filepath, registry):
-        """Parse an RIR delegated file."""
+        """Parse an RIR delegated file.
+
+        The file is decoded and split into lines in one pass each, both in C,
+        rather than pulling lines one at a time through the text layer. A
+        trailing carriage return is removed along with other whitespace when
+        each line is stripped.
+        """
         entries = []
 
         print("Parsing " + registry.upper() + " file...")
 
         try:
-            with open(filepath, "r", encoding="utf-8", errors="ignore") as f:
-                for line_num, line in enumerate(f, 1):
-                    try:
-                        parsed_entries = self._parse_line(line, registry)
-                        if parsed_entries:
-                            entries.extend(parsed_entries)
-                    except ValueError as e:
-                        warnings.warn(
-                            "Error parsing line "
-                            + str(line_num)
-                            + " in "
-                            + registry
-                            + ": "
-                            + str(e)
-                        )
-                        continue
-
+            lines = _read_text(filepath).split("\n")
         except OSError as e:
             print("Failed to parse file " + str(filepath) + ": " + str(e))
             return []
 
+        for line_num, line in enumerate(lines, 1):
+            try:
+                parsed_entries = self._parse_line(line, registry)
+                if parsed_entries:
+                    entries.extend(parsed_entries)
+            except ValueError as e:
+                warnings.warn(
+                    "Error parsing line "
+                    + str(line_num)
+                    + " in "
+                    + registry
+                    + ": "
+                    + str(e)
+                )
+                continue
+
         print("  Parsed " + str(len(entries)) + " entries from " + registry.upper())
         return entries
 
-    def parse_all_files(self, rir_files):
-        """Parse all RIR files and return combined entries."""
-        all_entries = []
+    def parse_all_files(self, rir_files, processes=1):
+        """Parse all RIR files and return combined entries.
 
-        for registry, filepath in rir_files.items():
-            entries = self.parse_file(filepath, registry)
-            all_entries.extend(entries)
+        Args:
+            rir_files: Mapping of registry name to delegated file path
+            processes: Number of worker processes. With more than one, each
+                file is parsed in its own process; on platforms that spawn
+                workers the caller must be import-safe (a __main__ guard).
+        """
+        all_entries = []
+        max_workers = min(len(rir_files), processes)
+
+        if max_workers < 2:
+            for registry, filepath in rir_files.items():
+                entries = self.parse_file(filepath, registry)
+                all_entries.extend(entries)
+        else:
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                futures = [
+                    executor.submit(self.parse_file, filepath, registry)
+                    for registry, filepath in rir_files.items()
+                ]
+                for future in futures:
+                    all_entries.extend(future.result())
 
         print("\nTotal parsed entries: " + str(len(all_entries)))
         return all_entries
@@ -179,11 +255,11 @@ class RIRParser:
                     group, key=lambda x: (x.date, x.registry), reverse=True
                 )
 
-                country_codes = {entry.cc for entry in group}
-                if len(country_codes) > 1:
+                first_cc = group[0].cc
+                if any(entry.cc != first_cc for entry in group):
                     conflicts.append(
                         {
-                            "prefix": str(prefix),
+                            "prefix": _format_prefix(prefix),
                             "entries": [(e.registry, e.cc, e.date) for e in group],
                             "chosen": (
                                 sorted_group[0].registry,